@@ -30,6 +30,9 @@ setup(
     ],
     python_requires=">=3.7",
     install_requires=requirements,
+    extras_require={
+        "batch": ["yt-dlp", "aiohttp", "aiofiles"],
+    },
     entry_points={
         "console_scripts": [
             "yt-dl=yt_dl.downloader:main",
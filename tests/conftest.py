@@ -0,0 +1,103 @@
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+
+class MediaHandler(BaseHTTPRequestHandler):
+    """Serves the server's payload, honouring Range headers like a media CDN."""
+    
+    protocol_version = "HTTP/1.1"
+    
+    def log_message(self, format, *args):
+        pass
+    
+    def do_GET(self):
+        server = self.server
+        payload = server.payload
+        
+        with server.lock:
+            server.requests.append(self.headers.get("Range"))
+            server.connections.add(self.client_address)
+        
+        if self.path.startswith("/missing"):
+            self._send(404, b"not found")
+            return
+        
+        if self.path.startswith("/slow"):
+            time.sleep(1)
+            self._send(200, b"late")
+            return
+        
+        start, end, status = 0, len(payload) - 1, 200
+        match = re.match(r"bytes=(\d+)-(\d+)", self.headers.get("Range") or "")
+        if match and server.ranges:
+            start, end = int(match.group(1)), min(int(match.group(2)), len(payload) - 1)
+            status = 206
+            if start in server.fail_status:
+                self._send(server.fail_status[start], b"error")
+                return
+        
+        # pytube asks for byte ranges with a query parameter instead
+        match = re.search(r"[?&]range=(\d+)-(\d+)", self.path)
+        if match:
+            start, end = int(match.group(1)), min(int(match.group(2)), len(payload) - 1)
+        
+        self.send_response(status)
+        self.send_header("Content-Length", str(end - start + 1))
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(payload)}")
+        self.end_headers()
+        
+        body = payload[start:end + 1]
+        with server.lock:
+            truncate = start in server.fail_once
+            server.fail_once.discard(start)
+        if truncate:
+            # Drop the connection halfway through the body
+            body = body[:len(body) // 2]
+            self.close_connection = True
+        
+        delay = server.slow.get(start, 0)
+        try:
+            for i in range(0, len(body), 1 << 16):
+                time.sleep(delay)
+                self.wfile.write(body[i:i + (1 << 16)])
+                with server.lock:
+                    server.bytes_sent += len(body[i:i + (1 << 16)])
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+    
+    def _send(self, status, body):
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def media_server():
+    """Local HTTP server serving server.payload, see MediaHandler."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MediaHandler)
+    server.daemon_threads = True
+    # Clients dropping connections mid-body is expected, keep the output quiet
+    server.handle_error = lambda request, client_address: None
+    server.payload = b""
+    server.ranges = True
+    server.fail_once = set()
+    server.fail_status = {}
+    server.slow = {}
+    server.requests = []
+    server.connections = set()
+    server.bytes_sent = 0
+    server.lock = threading.Lock()
+    server.base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    server.url = f"{server.base_url}/media"
+    
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
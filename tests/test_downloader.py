@@ -0,0 +1,344 @@
+import os
+import socket
+import subprocess
+import time
+from types import SimpleNamespace
+from urllib.error import HTTPError, URLError
+
+import pytest
+from pytube import request as pytube_request
+
+from yt_dl.downloader import YouTubeDownloader, _atomic_output
+
+
+@pytest.fixture
+def downloader(tmp_path):
+    return YouTubeDownloader(output_path=str(tmp_path))
+
+
+def test_parallel_download_reassembles_parts(downloader, media_server, tmp_path):
+    media_server.payload = os.urandom((1 << 20) + 37)
+    dst = tmp_path / "video.mp4"
+    
+    downloader._parallel_download(media_server.url, len(media_server.payload), str(dst), parts=8)
+    
+    assert dst.read_bytes() == media_server.payload
+    assert len(media_server.requests) == 8
+    # Each part needs its own connection to get past per-connection throttling
+    assert len(media_server.connections) > 1
+
+
+def test_parallel_download_resumes_failed_part(downloader, media_server, tmp_path):
+    media_server.payload = os.urandom(1 << 20)
+    media_server.fail_once = {1 << 19}
+    dst = tmp_path / "video.mp4"
+    
+    downloader._parallel_download(media_server.url, len(media_server.payload), str(dst), parts=2)
+    
+    assert dst.read_bytes() == media_server.payload
+    # Only the bytes the failed part did not receive are requested again
+    first, second, retry = media_server.requests
+    assert {first, second} == {"bytes=0-524287", "bytes=524288-1048575"}
+    retry_start, retry_end = map(int, retry[len("bytes="):].split("-"))
+    assert 1 << 19 < retry_start <= (1 << 19) + (1 << 18)
+    assert retry_end == (1 << 20) - 1
+
+
+def test_parallel_download_removes_file_on_failure(downloader, media_server, tmp_path):
+    media_server.payload = os.urandom(1 << 16)
+    media_server.ranges = False
+    dst = tmp_path / "video.mp4"
+    
+    with pytest.raises(Exception, match="range requests"):
+        downloader._parallel_download(media_server.url, len(media_server.payload), str(dst))
+    
+    assert not dst.exists()
+
+
+def test_parallel_download_fails_without_waiting_for_other_parts(downloader, media_server, tmp_path):
+    media_server.payload = os.urandom(1 << 20)
+    # Part 0 takes about 3 s to stream while part 1 fails immediately
+    media_server.slow = {0: 0.4}
+    media_server.fail_status = {1 << 19: 500}
+    dst = tmp_path / "video.mp4"
+    
+    started = time.monotonic()
+    with pytest.raises(Exception, match="500"):
+        downloader._parallel_download(media_server.url, len(media_server.payload), str(dst), parts=2)
+    
+    assert time.monotonic() - started < 1.5
+    assert not dst.exists()
+
+
+def test_atomic_output_leaves_no_file_on_failure(tmp_path):
+    dst = tmp_path / "video.mp4"
+    
+    with pytest.raises(RuntimeError):
+        with _atomic_output(str(dst)) as part_path:
+            with open(part_path, "wb") as fh:
+                fh.write(b"partial")
+            raise RuntimeError("connection reset")
+    
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_cached_file_hit_and_force(downloader, tmp_path):
+    with _atomic_output(str(tmp_path / "abc_720p.mp4")) as part_path:
+        with open(part_path, "wb") as fh:
+            fh.write(b"video")
+    
+    assert downloader._cached_file("abc_720p.mp4") == str(tmp_path / "abc_720p.mp4")
+    assert downloader._cached_file("abc_720p.mp4", force=True) is None
+    assert downloader._cached_file("abc_1080p.mp4") is None
+
+
+def test_get_video_info_reuses_loaded_youtube_object(downloader, monkeypatch):
+    yt = SimpleNamespace(
+        video_id="abc", _vid_info={"videoDetails": {}}, title="Title", author="Author",
+        length=60, views=10, publish_date=None, description="d" * 300
+    )
+    monkeypatch.setattr(YouTubeDownloader, "_yt", staticmethod(lambda url: yt))
+    monkeypatch.setattr(downloader, "_innertube_player", pytest.fail)
+    
+    info = downloader.get_video_info("https://youtu.be/abc")
+    
+    assert info["title"] == "Title"
+    assert info["description"] == "d" * 200 + "..."
+
+
+def test_download_mp3_sanitizes_explicit_filename(downloader, monkeypatch, tmp_path):
+    yt = SimpleNamespace(video_id="abc", title="Title")
+    stream = SimpleNamespace(url="https://example.com/audio", filesize=10)
+    monkeypatch.setattr(YouTubeDownloader, "_yt", staticmethod(lambda url: yt))
+    monkeypatch.setattr(downloader, "_get_audio_stream", lambda yt: stream)
+    monkeypatch.setattr(downloader, "_ffmpeg", "ffmpeg")
+    monkeypatch.setattr(downloader, "_stream_to_mp3", lambda url, path: open(path, "wb").close())
+    
+    path = downloader.download_mp3("https://youtu.be/abc", filename='../a:b?"c" ')
+    
+    assert path == str(tmp_path / '.._a_b__c_.mp3')
+    assert os.listdir(tmp_path) == ['.._a_b__c_.mp3']
+
+
+def _playlist_downloader(downloader, monkeypatch):
+    monkeypatch.setattr(
+        YouTubeDownloader, "_yt", staticmethod(lambda url: SimpleNamespace(video_id=url[-3:]))
+    )
+    downloader.prefetched = []
+    monkeypatch.setattr(downloader, "_prefetch", downloader.prefetched.append)
+    return downloader
+
+
+def test_download_playlist_skips_prefetch_for_cached_videos(downloader, monkeypatch, tmp_path):
+    downloader = _playlist_downloader(downloader, monkeypatch)
+    for video_id in ("abc", "def"):
+        (tmp_path / f"{video_id}_720p.mp4").write_bytes(b"video")
+    
+    paths = downloader.download_playlist(["https://youtu.be/abc", "https://youtu.be/def"])
+    
+    assert paths == [str(tmp_path / "abc_720p.mp4"), str(tmp_path / "def_720p.mp4")]
+    assert downloader.prefetched == []
+
+
+def test_download_playlist_prefetches_next_video(downloader, monkeypatch, tmp_path):
+    downloader = _playlist_downloader(downloader, monkeypatch)
+    downloaded = []
+    
+    def download_mp3(url, force=False):
+        downloaded.append((url, list(downloader.prefetched)))
+        if url.endswith("def"):
+            raise Exception("boom")
+        return url
+    
+    monkeypatch.setattr(downloader, "download_mp3", download_mp3)
+    (tmp_path / "ghi.mp3").write_bytes(b"audio")
+    urls = ["https://youtu.be/abc", "https://youtu.be/def", "https://youtu.be/ghi"]
+    
+    paths = downloader.download_playlist(urls, kind="mp3")
+    
+    assert paths == [urls[0], None, urls[2]]
+    assert downloader.prefetched == [urls[1]]
+    assert downloaded[1] == (urls[1], [urls[1]])
+
+
+def _stream(itag, resolution, progressive, subtype="mp4", audio=None):
+    return SimpleNamespace(
+        itag=itag,
+        resolution=resolution,
+        is_progressive=progressive,
+        is_adaptive=not progressive,
+        subtype=subtype,
+        includes_video_track=True,
+        includes_audio_track=progressive if audio is None else audio
+    )
+
+
+def _pytube_query(yt, resolution):
+    """The StreamQuery chain _get_video_stream used before chunk0-18."""
+    from pytube.query import StreamQuery
+    
+    streams = StreamQuery(yt.fmt_streams).filter(
+        progressive=True, file_extension='mp4', resolution=resolution
+    ).order_by('resolution').desc()
+    if streams:
+        return streams.first()
+    return StreamQuery(yt.fmt_streams).filter(
+        adaptive=True, only_video=True, file_extension='mp4', resolution=resolution
+    ).order_by('resolution').desc().first()
+
+
+@pytest.mark.parametrize("resolution", ["360p", "720p", "1080p", "2160p"])
+def test_get_video_stream_matches_stream_query(downloader, resolution):
+    yt = SimpleNamespace(fmt_streams=[
+        _stream(18, "360p", True),
+        _stream(22, "720p", True),
+        _stream(59, "720p", True),
+        _stream(137, "1080p", False),
+        _stream(248, "1080p", False, subtype="webm"),
+        _stream(399, "1080p", False),
+        _stream(140, None, False, audio=True),
+        _stream(299, "1080p", False, audio=True),
+    ])
+    
+    assert downloader._get_video_stream(yt, resolution) is _pytube_query(yt, resolution)
+
+
+def test_pytube_transport_read_and_info(downloader, media_server):
+    media_server.payload = b"x" * 1000
+    
+    response = pytube_request._execute_request(media_server.url)
+    
+    assert response.getcode() == 200
+    assert response.info()["content-length"] == "1000"
+    assert response.read(10) == b"x" * 10
+    assert response.read() == b"x" * 990
+    assert response.read() == b""
+
+
+def test_pytube_transport_raises_http_error(downloader, media_server):
+    with pytest.raises(HTTPError) as excinfo:
+        pytube_request.get(f"{media_server.base_url}/missing")
+    
+    assert excinfo.value.code == 404
+
+
+def test_pytube_transport_maps_timeouts(downloader, media_server):
+    with pytest.raises(URLError) as excinfo:
+        pytube_request._execute_request(f"{media_server.base_url}/slow", timeout=0.2)
+    
+    assert isinstance(excinfo.value.reason, socket.timeout)
+
+
+def test_pytube_stream_does_not_download_size_probe(downloader, media_server):
+    media_server.payload = os.urandom(24 << 20)
+    
+    data = b"".join(pytube_request.stream(f"{media_server.url}?id=1"))
+    
+    assert data == media_server.payload
+    # The probe for the file size must not pull the whole file a second time
+    time.sleep(0.5)
+    assert media_server.bytes_sent < 1.5 * len(media_server.payload)
+
+
+def test_check_disk_space_fails_fast(downloader, monkeypatch):
+    usage = SimpleNamespace(total=100, used=90, free=10)
+    monkeypatch.setattr("yt_dl.downloader.shutil.disk_usage", lambda path: usage)
+    
+    downloader._check_disk_space(10)
+    with pytest.raises(IOError, match="Insufficient disk space"):
+        downloader._check_disk_space(11)
+
+
+@pytest.fixture
+def ffmpeg(monkeypatch):
+    """Record ffmpeg invocations instead of running them."""
+    fake = SimpleNamespace(commands=[], fail_gpu=False)
+    
+    def run(command, **kwargs):
+        fake.commands.append(command)
+        stdout = "Hardware acceleration methods:\nvdpau\ncuda\nvaapi\n"
+        returncode = 1 if "h264_nvenc" in command and fake.fail_gpu else 0
+        return subprocess.CompletedProcess(command, returncode, stdout=stdout, stderr="error")
+    
+    monkeypatch.setattr("yt_dl.downloader.shutil.which", lambda name: "/usr/bin/ffmpeg")
+    monkeypatch.setattr("yt_dl.downloader.subprocess.run", run)
+    monkeypatch.setattr(YouTubeDownloader, "_hwaccel_methods", {})
+    return fake
+
+
+def test_resolve_hwaccel_probes_once(ffmpeg, tmp_path):
+    first = YouTubeDownloader(output_path=str(tmp_path), hwaccel="cuda")
+    second = YouTubeDownloader(output_path=str(tmp_path), hwaccel="cuda")
+    
+    assert first.hwaccel == second.hwaccel == "cuda"
+    assert YouTubeDownloader._hwaccel_methods == {"/usr/bin/ffmpeg": ["vdpau", "cuda", "vaapi"]}
+    assert len(ffmpeg.commands) == 1
+
+
+def test_resolve_hwaccel_unsupported(ffmpeg, tmp_path):
+    YouTubeDownloader._hwaccel_methods["/usr/bin/ffmpeg"] = ["vaapi"]
+    
+    assert YouTubeDownloader(output_path=str(tmp_path), hwaccel="cuda").hwaccel is None
+    assert ffmpeg.commands == []
+
+
+@pytest.mark.parametrize("codec, gpu", [("avc1.640028", True), ("av01.0.08M.08", False), (None, False)])
+def test_remux_uses_gpu_only_for_h264(ffmpeg, tmp_path, codec, gpu):
+    downloader = YouTubeDownloader(output_path=str(tmp_path), hwaccel="cuda")
+    ffmpeg.commands.clear()
+    
+    downloader._remux_mp4("video.mp4", "audio.mp4", str(tmp_path / "out.mp4"), codec)
+    
+    assert len(ffmpeg.commands) == 1
+    assert ("h264_nvenc" in ffmpeg.commands[0]) is gpu
+
+
+def test_remux_falls_back_to_copy_when_gpu_fails(ffmpeg, tmp_path):
+    downloader = YouTubeDownloader(output_path=str(tmp_path), hwaccel="cuda")
+    ffmpeg.commands.clear()
+    ffmpeg.fail_gpu = True
+    
+    downloader._remux_mp4("video.mp4", "audio.mp4", str(tmp_path / "out.mp4"), "avc1.640028")
+    
+    assert ["h264_nvenc" in command for command in ffmpeg.commands] == [True, False]
+
+
+def _format(height, ext="mp4", vcodec="avc1", acodec="mp4a", protocol="https", tbr=1000):
+    return {
+        "height": height, "ext": ext, "vcodec": vcodec, "acodec": acodec,
+        "protocol": protocol, "tbr": tbr, "url": f"https://example.com/{height}"
+    }
+
+
+MANIFEST = {"id": "abc", "formats": [
+    _format(360),
+    _format(720, tbr=1500),
+    _format(720, tbr=2500),
+    _format(1080, acodec="none"),
+    _format(1440, ext="webm"),
+    _format(2160, protocol="m3u8_native"),
+]}
+
+
+@pytest.mark.parametrize("resolution, height, tbr", [
+    ("360p", 360, 1000),
+    ("720p", 720, 2500),
+    ("720p60", 720, 2500),
+    ("best", 720, 2500),
+])
+def test_select_format(downloader, resolution, height, tbr):
+    video_format = downloader._select_format(MANIFEST, resolution)
+    
+    assert (video_format["height"], video_format["tbr"]) == (height, tbr)
+
+
+def test_select_format_warns_on_fallback(downloader, caplog):
+    video_format = downloader._select_format(MANIFEST, "1080p")
+    
+    assert video_format["height"] == 720
+    assert "No progressive 1080p stream for abc, using 720p" in caplog.text
+
+
+def test_select_format_without_progressive_formats(downloader):
+    with pytest.raises(Exception, match="No suitable video stream"):
+        downloader._select_format({"formats": [_format(1080, acodec="none")]}, "1080p")